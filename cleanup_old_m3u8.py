@@ -1,3 +1,5 @@
+import os
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
 import re
@@ -24,37 +26,56 @@ def extract_date(filename: str):
     if not match:
         return None
 
-    day = int(match.group(1))
-    month_name = match.group(3).lower()
-    year = int(match.group(4))
+    day, _, month_name, year = match.groups()
 
-    month = MONTHS.get(month_name)
+    # Longest month name is 9 chars; skip lowercasing anything longer
+    if len(month_name) > 9:
+        return None
+
+    month = MONTHS.get(month_name.lower())
     if not month:
         return None
 
-    return datetime(year, month, day)
+    return datetime(int(year), month, int(day))
+
+# ---------------------------
+# WALK
+# ---------------------------
+def iter_m3u8(root):
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".m3u8"):
+                    yield entry
 
 # ---------------------------
 # CLEANUP
 # ---------------------------
 def main():
     cutoff = datetime.utcnow() - timedelta(days=KEEP_DAYS)
+    cutoff_ts = time.time() - KEEP_DAYS * 86400
 
     if not BASE_DIR.exists():
         return
 
-    for path in BASE_DIR.rglob("*.m3u8"):
-        file_date = extract_date(path.name)
+    for entry in iter_m3u8(BASE_DIR):
+        # Filename date wins: a fresh checkout resets every mtime to "now"
+        file_date = extract_date(entry.name)
 
-        if not file_date:
-            continue
+        if file_date:
+            expired = file_date < cutoff
+        else:
+            expired = entry.stat(follow_symlinks=False).st_mtime < cutoff_ts
 
-        if file_date < cutoff:
+        if expired:
             try:
-                path.unlink()
-                print(f"🗑 Deleted: {path}")
+                os.unlink(entry.path)
+                print(f"🗑 Deleted: {entry.path}")
             except Exception as e:
-                print(f"✖ Failed delete {path}: {e}")
+                print(f"✖ Failed delete {entry.path}: {e}")
 
 if __name__ == "__main__":
     main()
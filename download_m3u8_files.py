@@ -1,13 +1,27 @@
 import asyncio
 import aiohttp
-import aiofiles
 import json
 import re
 import random
+import os
+import shutil
+import time
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
 from urllib.parse import urlparse
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # ---------------------------
 # LOGGING
 # ---------------------------
@@ -21,8 +35,8 @@ log = logging.getLogger("m3u8_downloader")
 # CONFIG
 # ---------------------------
 INPUT_JSON = Path("show_m3u8_links.json")
+PLAYER_JSON = Path("player_links.json")
 BASE_DIR = Path("m3u8_files")
-MAX_CONCURRENT = 5
 JITTER_MIN, JITTER_MAX = 0.2, 0.6
 RETRIES = 3
 TIMEOUT = 30
@@ -31,51 +45,141 @@ MAX_CONCURRENCY = 8
 MIN_CONCURRENCY = 1
 CONCURRENCY_STEP = 1
 MAX_PASSES = 5
+KEEPALIVE_TIMEOUT = 75
+DNS_CACHE_TTL = 300
+WINDOW_SIZE = 10  # outcomes per concurrency adjustment
+HOST_RATE = 5  # requests per second per host
+HOST_BURST = 10
+SKIP_IF_NEWER_THAN_S = 6 * 3600
+
+# ---------------------------
+# ADAPTIVE CONCURRENCY
+# ---------------------------
+class AdaptiveConcurrency:
+    """Admission gate whose limit can be resized while jobs are in flight."""
+
+    def __init__(self, limit, lo=MIN_CONCURRENCY, hi=MAX_CONCURRENCY):
+        self.active = 0
+        self.limit = limit
+        self.lo = lo
+        self.hi = hi
+        self._cond = asyncio.Condition(asyncio.Lock())
+        self._window = deque(maxlen=WINDOW_SIZE)
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify(1)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.release()
+
+    async def set_limit(self, limit):
+        limit = max(self.lo, min(self.hi, limit))
+        async with self._cond:
+            raised = limit > self.limit
+            self.limit = limit
+            if raised:
+                self._cond.notify_all()
+
+    async def record(self, ok):
+        self._window.append(ok)
+        if len(self._window) < WINDOW_SIZE:
+            return
+
+        # Same rule as the old per-pass step, applied to a rolling window
+        previous = self.limit
+        if all(self._window):
+            await self.set_limit(self.limit + CONCURRENCY_STEP)
+        else:
+            await self.set_limit(self.limit - CONCURRENCY_STEP)
+        self._window.clear()
+
+        if self.limit > previous:
+            log.info(f"Increasing concurrency → {self.limit}")
+        elif self.limit < previous:
+            log.info(f"Decreasing concurrency → {self.limit}")
+
+# ---------------------------
+# PER-HOST RATE LIMIT
+# ---------------------------
+class HostRateLimiter:
+    """Token bucket per host; only sleeps when a host is hit too fast."""
+
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+
+    async def acquire(self, host):
+        while True:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[host] = (tokens - 1, now)
+                return
+            self._buckets[host] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+rate_limiter = HostRateLimiter()
 
 # ---------------------------
 # SAFE FILENAME
 # ---------------------------
+SAFE_NAME_RE = re.compile(r"[^a-zA-Z0-9]+")
+
+@lru_cache(maxsize=8192)
 def safe_name(title):
-    return re.sub(r"[^a-zA-Z0-9]+", "_", title).strip("_")
+    return SAFE_NAME_RE.sub("_", title).strip("_")
+
+def episode_path(folder, episode_title):
+    return folder / (safe_name(episode_title) + ".m3u8")
 
 # ---------------------------
 # REWRITE M3U8 FILE
 # ---------------------------
-async def rewrite_m3u8(path: Path, host: str):
-    async with aiofiles.open(path, "r", encoding="utf-8") as f:
-        lines = (await f.read()).splitlines()
-    out = []
-    vod_inserted = False
+VOD_TAG = b"#EXT-X-PLAYLIST-TYPE:VOD"
+EDGE_WS_RE = re.compile(rb"^[ \t\x0b\x0c]+|[ \t\x0b\x0c]+$", re.MULTILINE)
+VERSION_RE = re.compile(rb"^#EXT-X-VERSION[^\n]*", re.MULTILINE)
+REL_PATH_RE = re.compile(rb"^(?=/(?!/))", re.MULTILINE)
 
-    for i, line in enumerate(lines):
-        line = line.strip()
-        if i == 0 and line == "#EXTM3U":
-            out.append(line)
-            continue
-        if not vod_inserted and line.startswith("#EXT-X-VERSION"):
-            out.append(line)
-            out.append("#EXT-X-PLAYLIST-TYPE:VOD")
-            vod_inserted = True
-            continue
-        if line.startswith("/") and not line.startswith("//"):
-            out.append(host + line)
-        else:
-            out.append(line)
+def rewrite_m3u8_bytes(data: bytes, host: str) -> bytes:
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    data = EDGE_WS_RE.sub(b"", data)
 
-    if not vod_inserted:
-        out.insert(1, "#EXT-X-PLAYLIST-TYPE:VOD")
+    data, found = VERSION_RE.subn(rb"\g<0>\n" + VOD_TAG, data, count=1)
+    if not found:
+        head, _, rest = data.partition(b"\n")
+        data = head + b"\n" + VOD_TAG + b"\n" + rest
 
-    async with aiofiles.open(path, "w", encoding="utf-8") as f:
-        await f.write("\n".join(out) + "\n")
+    data = REL_PATH_RE.sub(host.encode(), data)
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    return data
 
 # ---------------------------
 # DOWNLOAD SINGLE M3U8
 # ---------------------------
-async def download_m3u8(session, url, outpath: Path):
+@lru_cache(maxsize=256)
+def host_of(url):
     parsed = urlparse(url)
-    host = f"{parsed.scheme}://{parsed.netloc}"
+    return f"{parsed.scheme}://{parsed.netloc}"
 
-    headers = {
+@lru_cache(maxsize=256)
+def headers_for(host):
+    # Shared across requests to the same host; never mutate
+    return {
         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) "
                       "AppleWebKit/537.36 (KHTML, like Gecko) "
                       "Chrome/120.0.0.0 Safari/537.36",
@@ -85,93 +189,148 @@ async def download_m3u8(session, url, outpath: Path):
         "Accept-Language": "en-US,en;q=0.9",
     }
 
+async def download_m3u8(session, url):
+    host = host_of(url)
+    headers = headers_for(host)
+
     for attempt in range(RETRIES):
         try:
             async with session.get(url, headers=headers, timeout=TIMEOUT) as resp:
                 if resp.status != 200:
                     raise aiohttp.ClientError(f"Status {resp.status}")
-                data = await resp.read()
-                async with aiofiles.open(outpath, "wb") as f:
-                    await f.write(data)
-                return host
+                return host, await resp.read()
         except Exception as e:
             if attempt < RETRIES - 1:
                 await asyncio.sleep(random.uniform(JITTER_MIN, JITTER_MAX))
             else:
                 raise e
 
+# ---------------------------
+# HTTP SESSION
+# ---------------------------
+def make_session():
+    # Sized for the controller's ceiling so the connector never caps it
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONCURRENCY * 4,
+        limit_per_host=MAX_CONCURRENCY,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        enable_cleanup_closed=True,
+        force_close=False,
+    )
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
 # ---------------------------
 # PROCESS SINGLE EPISODE
 # ---------------------------
-async def process_episode(sema, session, job, results):
-    async with sema:
-        channel, show, episode_title, info = job
-        key = (channel, show, episode_title)
+async def process_episode(session, job):
+    folder, episode_title, info = job
 
-        if not info or "m3u8_url" not in info:
-            log.warning(f"✖ Skipping {episode_title} (no m3u8)")
-            results[key] = False
-            return
+    if not info or "m3u8_url" not in info:
+        log.warning(f"✖ Skipping {episode_title} (no m3u8)")
+        return None
 
-        folder = BASE_DIR / safe_name(channel) / safe_name(show)
-        folder.mkdir(parents=True, exist_ok=True)
-        outpath = folder / (safe_name(episode_title) + ".m3u8")
+    outpath = episode_path(folder, episode_title)
 
-        await asyncio.sleep(random.uniform(JITTER_MIN, JITTER_MAX))
+    await rate_limiter.acquire(host_of(info["m3u8_url"]))
+    try:
+        log.info(f"⬇️ Downloading {episode_title}")
+        host, raw = await download_m3u8(session, info["m3u8_url"])
+        # A few KB: a direct write beats a thread-pool round trip
+        outpath.write_bytes(rewrite_m3u8_bytes(raw, host))
+        log.info(f"✅ Saved → {outpath}")
+        return True
+    except Exception as e:
+        log.warning(f"✖ Failed {episode_title}: {e}")
+        return False
+
+# ---------------------------
+# WORKER
+# ---------------------------
+async def worker(queue, done, session, controller, idle):
+    me = asyncio.current_task()
+    while True:
+        # Only idle workers may be cancelled when the pool shrinks
+        idle.add(me)
+        job = await queue.get()
+        idle.discard(me)
         try:
-            log.info(f"⬇️ Downloading {episode_title}")
-            host = await download_m3u8(session, info["m3u8_url"], outpath)
-            await rewrite_m3u8(outpath, host)
-            log.info(f"✅ Saved → {outpath}")
-            results[key] = True
+            async with controller:
+                ok = await process_episode(session, job)
         except Exception as e:
-            log.warning(f"✖ Failed {episode_title}: {e}")
-            results[key] = False
+            log.warning(f"✖ Worker error on {job[1]}: {e}")
+            ok = False
+        done.put_nowait((job, ok))
+        queue.task_done()
+
+def resize_pool(workers, idle, size, spawn):
+    while len(workers) < size:
+        workers.add(spawn())
+    for task in list(idle):
+        if len(workers) <= size:
+            break
+        idle.discard(task)
+        workers.discard(task)
+        task.cancel()
 
 # ---------------------------
 # ADAPTIVE RUNNER
 # ---------------------------
 async def adaptive_runner(jobs):
-    concurrency = INITIAL_CONCURRENCY
+    controller = AdaptiveConcurrency(INITIAL_CONCURRENCY)
     passes = 0
     pending = jobs
     results = {}
 
-    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENT)
-    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+    queue = asyncio.Queue()
+    done = asyncio.Queue()
+    workers = set()
+    idle = set()
+
+    # The task group owns the workers: an error anywhere tears all of them down
+    async with make_session() as session, asyncio.TaskGroup() as tg:
+        def spawn():
+            return tg.create_task(worker(queue, done, session, controller, idle))
+
         while pending and passes < MAX_PASSES:
             passes += 1
             total = len(pending)
             log.info("=" * 60)
             log.info(f"PASS {passes}")
-            log.info(f"Concurrency: {concurrency}")
+            log.info(f"Concurrency: {controller.limit}")
             log.info(f"Total episodes: {total}")
 
-            sem = asyncio.Semaphore(concurrency)
-            await asyncio.gather(*(process_episode(sem, session, job, results) for job in pending))
+            for job in pending:
+                queue.put_nowait(job)
+            resize_pool(workers, idle, controller.limit, spawn)
 
-            failed = [job for job in pending if not results[(job[0], job[1], job[2])]]
-            success = total - len(failed)
+            # Drain results as they finish instead of waiting for stragglers
+            failed = []
+            for _ in range(total):
+                job, ok = await done.get()
+                results[(job[0], job[1])] = bool(ok)
+                if not ok:
+                    failed.append(job)
+                if ok is not None:
+                    await controller.record(ok)
+                resize_pool(workers, idle, controller.limit, spawn)
 
-            log.info(f"Success: {success}")
+            log.info(f"Success: {total - len(failed)}")
             log.info(f"Failed: {len(failed)}")
 
-            # Adaptive concurrency
-            if success == total and concurrency < MAX_CONCURRENCY:
-                concurrency += CONCURRENCY_STEP
-                log.info(f"Increasing concurrency → {concurrency}")
-            elif success < total and concurrency > MIN_CONCURRENCY:
-                concurrency -= CONCURRENCY_STEP
-                log.info(f"Decreasing concurrency → {concurrency}")
-
             pending = failed
 
+        for task in workers:
+            task.cancel()
+
     if pending:
         log.warning(f"Unresolved episodes after {MAX_PASSES} passes: {len(pending)}")
     else:
         log.info("All episodes resolved")
 
+    return results
+
 # ---------------------------
 # MAIN
 # ---------------------------
@@ -180,18 +339,59 @@ async def main():
         log.error(f"{INPUT_JSON} not found")
         return
 
-    with INPUT_JSON.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    raw = INPUT_JSON.read_bytes()
+    data = orjson.loads(raw) if orjson else json.loads(raw)
+
+    # Files written after the latest player scrape (e.g. by the extractor's
+    # pipelined downloads) are current. A fresh checkout stamps every file with
+    # the checkout time, which is older than the scrape, so those still refresh.
+    fresh_since = time.time() - SKIP_IF_NEWER_THAN_S
+    if PLAYER_JSON.exists():
+        fresh_since = max(fresh_since, PLAYER_JSON.stat().st_mtime)
 
     jobs = []
+    url_to_jobs = {}
+    skipped = {}
     for channel, shows in data.items():
         for show, episodes in shows.items():
+            # Folder is resolved once per show, not per episode
+            folder = BASE_DIR / safe_name(channel) / safe_name(show)
+            folder.mkdir(parents=True, exist_ok=True)
+            with os.scandir(folder) as it:
+                mtimes = {e.name: e.stat().st_mtime for e in it if e.is_file()}
             for ep, info in episodes.items():
-                jobs.append((channel, show, ep, info))
+                job = (folder, ep, info)
+                if not info or "m3u8_url" not in info:
+                    jobs.append(job)
+                    continue
+                # Episodes sharing a stream are downloaded once
+                same_url = url_to_jobs.setdefault(info["m3u8_url"], [])
+                if not same_url:
+                    if mtimes.get(episode_path(folder, ep).name, 0) > fresh_since:
+                        skipped[(folder, ep)] = True
+                    else:
+                        jobs.append(job)
+                same_url.append(job)
+
+    # Keep jobs for the same CDN host adjacent so they share pooled connections
+    jobs.sort(key=lambda job: host_of(job[2]["m3u8_url"]) if job[2] and "m3u8_url" in job[2] else "")
 
+    log.info(f"Up to date, skipped: {len(skipped)}")
     log.info(f"Total episodes queued: {len(jobs)}")
-    await adaptive_runner(jobs)
+    results = await adaptive_runner(jobs)
+    results.update(skipped)
+
+    for same_url in url_to_jobs.values():
+        primary, duplicates = same_url[0], same_url[1:]
+        if not duplicates or not results.get((primary[0], primary[1])):
+            continue
+        src = episode_path(primary[0], primary[1])
+        for folder, ep, _ in duplicates:
+            dst = episode_path(folder, ep)
+            shutil.copyfile(src, dst)
+            log.info(f"📄 Copied {src.name} → {dst}")
 
 # ---------------------------
 if __name__ == "__main__":
-    asyncio.run(main())
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop else None) as runner:
+        runner.run(main())
@@ -1,148 +1,507 @@
 import asyncio
 import json
+import logging
+import queue
+import sys
+import time
+import aiohttp
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from urllib.parse import urlparse
 from playwright.async_api import async_playwright
 
+import download_m3u8_files as downloader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+log = logging.getLogger("m3u8_extractor")
+LOG_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+
 PLAYER_JSON = Path("player_links.json")
 OUTPUT_JSON = Path("show_m3u8_links.json")
+OUTPUT_TMP = OUTPUT_JSON.with_suffix(".json.tmp")
+FLUSH_INTERVAL_S = 10
+# domain -> {"winner": last winning player, "fail_streak": misses since,
+#            "ts": epoch seconds of the last win or first sighting}
+DOMAIN_CACHE_JSON = Path("domain_cache.json")
+DEAD_DOMAIN_STREAK = 10  # episodes in a row the domain missed on
+DOMAIN_CACHE_TTL_S = 30 * 86400
+# kept between runs (actions/cache on CI) so player shells load from disk
+CHROME_PROFILE_DIR = Path(".chrome-profile")
+CHROME_CACHE_DIR = Path(".chromium-cache")
+DISK_CACHE_BYTES = 512 * 1024 * 1024
+MEDIA_CACHE_BYTES = 256 * 1024 * 1024
 
 REQUEST_TIMEOUT = 8000  # 8 seconds
+GOTO_TIMEOUT = 10000  # only has to reach commit
+RESET_TIMEOUT = 2000  # about:blank between episodes
+HEAD_TIMEOUT_S = 1.0
+# worst case per episode: cached solo probe, then the fan-out,
+# each a HEAD check, goto + wait, and the tab reset
+EPISODE_WORST_S = 2 * (
+    HEAD_TIMEOUT_S + (GOTO_TIMEOUT + REQUEST_TIMEOUT + RESET_TIMEOUT) / 1000
+)
+DEAD_URL_TTL_S = 3600
+DEAD_STATUSES = {404, 410}
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/120.0.0.0 Safari/537.36"
+)
 INITIAL_CONCURRENCY = 4
 MAX_CONCURRENCY = 8
 MIN_CONCURRENCY = 1
 CONCURRENCY_STEP = 1
-MAX_PASSES = 5  # fail-safe to avoid infinite loops
+MAX_PASSES = 5  # attempts per episode, fail-safe to avoid infinite loops
+DOWNLOAD_WORKERS = downloader.INITIAL_CONCURRENCY
+
+M3U8_SUFFIXES = (".m3u8", ".M3U8")
+# resource types that never carry a playlist (hls.js uses xhr/fetch,
+# native playback media); skipped before any URL work
+NON_M3U8_TYPES = frozenset({
+    "image", "stylesheet", "font", "script", "manifest", "texttrack",
+})
+
+# images, fonts and stylesheets only: Chromium may match these anywhere in
+# the URL, so nothing that can show up in a playlist path, a player host or
+# a script name (media extensions, .ico vs .icons.js) belongs here
+BLOCKED_EXTENSIONS = (
+    "png", "jpg", "jpeg", "gif", "webp", "avif", "bmp",
+    "woff", "woff2", "ttf", "otf", "eot", "css",
+)
+BLOCKED_URL_PATTERNS = [f"*.{ext}" for ext in BLOCKED_EXTENSIONS] + [
+    "*/analytics*",
+    "*/gtag*",
+    "*google-analytics*",
+    "*googletagmanager*",
+    "*doubleclick*",
+    "*facebook.net*",
+]
 
 # ---------------------------
+@lru_cache(maxsize=4096)
 def get_domain(url):
-    return urlparse(url).netloc
+    start = url.find("://")
+    start = 0 if start < 0 else start + 3
+    end = len(url)
+    for sep in "/?#":
+        i = url.find(sep, start, end)
+        if i >= 0:
+            end = i
+    return url[start:end]
 
 # ---------------------------
-async def extract_m3u8(page, url, timeout_ms=REQUEST_TIMEOUT):
-    loop = asyncio.get_running_loop()
-    future = loop.create_future()
+m3u8_waiters = {}  # page -> future of the navigation in flight
+
+async def new_tab(context):
+    # the CDP session is only for URL blocking, which happens inside
+    # Chromium, so blocked requests never round-trip to Python
+    page = await context.new_page()
+    cdp = await context.new_cdp_session(page)
+    await cdp.send("Network.enable", {})
+    await cdp.send("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
 
+    # one listener for the tab's lifetime instead of one per navigation;
+    # Playwright's request event also covers out-of-process iframes and workers
     def on_request(request):
-        if request.url.lower().endswith(".m3u8") and not future.done():
-            future.set_result(request)
+        future = m3u8_waiters.get(page)
+        if future is None or future.done() or request.resource_type in NON_M3U8_TYPES:
+            return
+        request_url = request.url
+        if is_m3u8(request_url):
+            future.set_result(request_url)
 
     page.on("request", on_request)
+    return page
 
+async def release_tab(page_pool, tab):
     try:
-        await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-        req = await asyncio.wait_for(future, timeout_ms / 1000)
-        return [req]
-    except asyncio.TimeoutError:
-        return []
+        # stop the last player so none of its requests leak into the next episode
+        await tab.goto("about:blank", wait_until="commit", timeout=RESET_TIMEOUT)
+    except Exception:
+        # the player killed or wedged the tab; hand back a fresh one instead
+        try:
+            if not tab.is_closed():
+                await tab.close()
+            tab = await new_tab(tab.context)
+        except Exception as e:
+            log.warning(f"Tab replacement failed: {e}")
     finally:
-        if not page.is_closed():
-            page.remove_listener("request", on_request)
+        # the pool never shrinks, whatever happened above
+        page_pool.put_nowait(tab)
 
 # ---------------------------
-async def process_episode(sema, context, channel, show, episode, players, results, domain_cache):
-    async with sema:
-        page = await context.new_page()
+def is_m3u8(url):
+    # suffix test on the path part, without slicing or lowercasing the URL
+    end = url.find("?")
+    return url.endswith(M3U8_SUFFIXES, 0, len(url) if end < 0 else end)
+
+# ---------------------------
+class DeadUrlProbe:
+    """Cheap HEAD check so players that are plainly gone skip the browser."""
+
+    def __init__(self, session):
+        self.session = session
+        self._dead = {}  # url -> monotonic time it was found gone
+
+    async def is_dead(self, url):
+        now = time.monotonic()
+        seen = self._dead.get(url)
+        if seen is not None and now - seen < DEAD_URL_TTL_S:
+            return True
+
         try:
-            found = False
-            ordered_players = list(players.items())
-
-            # prioritize player used previously
-            for i, (pname, url) in enumerate(ordered_players):
-                if domain_cache.get(get_domain(url)) == pname:
-                    ordered_players.insert(0, ordered_players.pop(i))
-                    break
-
-            for player_name, url in ordered_players:
-                m3u8s = await extract_m3u8(page, url)
-                if m3u8s:
-                    r = m3u8s[0]
-                    domain_cache[get_domain(url)] = player_name
-                    results[channel][show][episode] = {
-                        "m3u8_url": r.url,
-                        "player_used": player_name,
-                    }
-                    found = True
-                    break
-
-            if not found:
-                results[channel][show][episode] = None
-
-        finally:
-            if not page.is_closed():
-                await page.close()
-
-# ---------------------------
-async def adaptive_runner(context, episodes_list, results, domain_cache):
-    concurrency = INITIAL_CONCURRENCY
-    pass_count = 1
-
-    while episodes_list and pass_count <= MAX_PASSES:
-        sema = asyncio.Semaphore(concurrency)
-        tasks = []
-
-        for ch, sh, ep, players in episodes_list:
-            tasks.append(
-                process_episode(
-                    sema, context, ch, sh, ep, players, results, domain_cache
+            async with self.session.head(
+                url,
+                allow_redirects=True,
+                timeout=aiohttp.ClientTimeout(total=HEAD_TIMEOUT_S),
+            ) as resp:
+                dead = resp.status in DEAD_STATUSES
+        except Exception:
+            # slow or HEAD-hostile hosts still get the real browser attempt
+            return False
+
+        if dead:
+            self._dead[url] = now
+        return dead
+
+# ---------------------------
+async def extract_m3u8(page, probe, url, timeout_ms=REQUEST_TIMEOUT):
+    if await probe.is_dead(url):
+        return None
+
+    future = asyncio.get_running_loop().create_future()
+    m3u8_waiters[page] = future
+
+    try:
+        await page.goto(url, wait_until="commit", timeout=GOTO_TIMEOUT)
+        # a cancel scope on this task, no extra wrapper task like wait_for
+        async with asyncio.timeout(timeout_ms / 1000):
+            return await future
+    except TimeoutError:
+        return None
+    finally:
+        m3u8_waiters.pop(page, None)
+
+# ---------------------------
+async def probe_players(page_pool, probe, candidates, missed):
+    # one tab per player, all navigating at once; first m3u8 wins
+    tabs = []
+    tasks = {}
+    try:
+        for candidate in candidates:
+            tab = await page_pool.get()
+            tabs.append(tab)
+            # each goto starts as soon as its tab is free, on its own renderer
+            tasks[asyncio.create_task(extract_m3u8(tab, probe, candidate[1]))] = candidate
+
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                _, _, domain = tasks[task]
+                if task.exception() is None and task.result():
+                    return tasks[task], task.result()
+                missed.add(domain)
+        return None
+    finally:
+        # shielded, so an episode deadline can't cut the tab return short
+        cleanup = asyncio.ensure_future(finish_probe(page_pool, tasks, tabs))
+        cleanups.add(cleanup)
+        cleanup.add_done_callback(cleanups.discard)
+        await asyncio.shield(cleanup)
+
+cleanups = set()  # strong refs while a shielded cleanup outlives its episode
+
+async def finish_probe(page_pool, tasks, tabs):
+    for task in tasks:
+        task.cancel()
+    # gather does not cancel siblings on its own; wait for the cancels to land
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.gather(*(release_tab(page_pool, tab) for tab in tabs))
+
+# ---------------------------
+def winner_of(domain_cache, domain):
+    entry = domain_cache.get(domain)
+    return entry["winner"] if entry else None
+
+def record_win(domain_cache, domain, player_name):
+    domain_cache[domain] = {"winner": player_name, "fail_streak": 0, "ts": int(time.time())}
+
+def record_miss(domain_cache, domain):
+    entry = domain_cache.setdefault(
+        domain, {"winner": None, "fail_streak": 0, "ts": int(time.time())}
+    )
+    entry["fail_streak"] += 1
+
+def is_dead_domain(domain_cache, domain):
+    entry = domain_cache.get(domain)
+    return entry is not None and entry["fail_streak"] >= DEAD_DOMAIN_STREAK
+
+# ---------------------------
+async def process_episode(
+    page_pool, probe, channel, show, episode, players, results, domain_cache,
+    download_queue, missed,
+):
+    # domain is parsed once per player, not again on the cache update
+    candidates = [(pname, url, get_domain(url)) for pname, url in players.items()]
+
+    # drop domains that keep failing, unless that would leave nothing to try
+    alive = [c for c in candidates if not is_dead_domain(domain_cache, c[2])]
+    candidates = alive or candidates
+
+    # the stable sort moves the previous winner to the front, rest keep order
+    ordered_players = sorted(
+        candidates, key=lambda c: winner_of(domain_cache, c[2]) != c[0]
+    )
+
+    # the cached winner gets a solo try; fan out only if it misses
+    found = None
+    rest = ordered_players
+    first = ordered_players[0] if ordered_players else None
+    if first and winner_of(domain_cache, first[2]) == first[0]:
+        found = await probe_players(page_pool, probe, [first], missed)
+        rest = ordered_players[1:]
+    if not found and rest:
+        found = await probe_players(page_pool, probe, rest, missed)
+
+    if not found:
+        results[channel][show][episode] = None
+        return
+
+    (player_name, _, domain), m3u8_url = found
+    record_win(domain_cache, domain, player_name)
+    missed.discard(domain)
+    results[channel][show][episode] = {
+        "m3u8_url": m3u8_url,
+        "player_used": player_name,
+    }
+    download_queue.put_nowait((channel, show, episode, m3u8_url))
+
+# ---------------------------
+async def episode_worker(
+    work_q, controller, page_pool, probe, results, domain_cache, download_queue,
+):
+    while True:
+        channel, show, episode, players, attempt = await work_q.get()
+        missed = set()
+        try:
+            async with controller:
+                # hard stop, in case a navigation hangs past its own timeouts
+                async with asyncio.timeout(EPISODE_WORST_S * 1.5):
+                    await process_episode(
+                        page_pool, probe, channel, show, episode, players,
+                        results, domain_cache, download_queue, missed,
+                    )
+        except TimeoutError:
+            log.warning(f"✖ {episode}: timed out")
+            results[channel][show][episode] = None
+        except Exception as e:
+            log.warning(f"✖ {episode}: {e}")
+            results[channel][show][episode] = None
+
+        # one miss per domain per episode; retries of the same episode
+        # would otherwise count its hosts again
+        if attempt == 1:
+            for domain in missed:
+                record_miss(domain_cache, domain)
+
+        data = results[channel][show].get(episode)
+        ok = bool(data and "m3u8_url" in data)
+        await controller.record(ok)
+        # retries go to the back of the same queue, no pass barrier
+        if not ok and attempt < MAX_PASSES:
+            work_q.put_nowait((channel, show, episode, players, attempt + 1))
+        work_q.task_done()
+
+# ---------------------------
+async def adaptive_runner(
+    page_pool, probe, episodes_list, results, domain_cache, download_queue,
+):
+    # one long-lived gate; the limit moves while episodes are in flight
+    controller = downloader.AdaptiveConcurrency(
+        INITIAL_CONCURRENCY, lo=MIN_CONCURRENCY, hi=MAX_CONCURRENCY
+    )
+    work_q = asyncio.Queue()
+    for channel, show, episode, players in episodes_list:
+        work_q.put_nowait((channel, show, episode, players, 1))
+
+    # workers beyond the current limit just wait on the gate
+    async with asyncio.TaskGroup() as tg:
+        workers = [
+            tg.create_task(
+                episode_worker(
+                    work_q, controller, page_pool, probe, results, domain_cache,
+                    download_queue,
                 )
             )
+            for _ in range(MAX_CONCURRENCY)
+        ]
+        await work_q.join()
+        for w in workers:
+            w.cancel()
 
-        await asyncio.gather(*tasks)
+    failed = sum(
+        1 for ch, sh, ep, _ in episodes_list
+        if not (results[ch][sh].get(ep) or {}).get("m3u8_url")
+    )
+    log.info("=" * 60)
+    log.info(f"Final concurrency: {controller.limit}")
+    log.info(f"Total episodes: {len(episodes_list)}")
+    log.info(f"Success: {len(episodes_list) - failed}")
+    log.info(f"Failed: {failed}")
 
-        failed = []
-        for ch, sh, ep, players in episodes_list:
-            data = results[ch][sh][ep]
-            if not data or "m3u8_url" not in data:
-                failed.append((ch, sh, ep, players))
+# ---------------------------
+async def download_consumer(download_queue, session):
+    # downloads start while extraction is still running
+    while True:
+        item = await download_queue.get()
+        if item is None:
+            return
+        channel, show, episode, m3u8_url = item
+        folder = downloader.BASE_DIR / downloader.safe_name(channel) / downloader.safe_name(show)
+        folder.mkdir(parents=True, exist_ok=True)
+        await downloader.process_episode(session, (folder, episode, {"m3u8_url": m3u8_url}))
 
-        success_count = len(episodes_list) - len(failed)
+# ---------------------------
+def load_domain_cache():
+    if not DOMAIN_CACHE_JSON.exists():
+        return {}
+    try:
+        raw = DOMAIN_CACHE_JSON.read_bytes()
+        data = orjson.loads(raw) if orjson else json.loads(raw)
+    except ValueError:
+        log.warning("domain_cache.json unreadable, starting empty")
+        return {}
+    now = int(time.time())
+    domain_cache = {}
+    for domain, entry in data.items():
+        # older files stored just the winning player name, without a timestamp
+        if not isinstance(entry, dict):
+            entry = {"winner": entry, "fail_streak": 0}
+        entry.setdefault("ts", now)
+        # halve streaks between runs, so pruned domains get probed again
+        # and a recovered host can win its way back
+        entry["fail_streak"] //= 2
+        # stale entries count as misses and get relearned
+        if now - entry["ts"] < DOMAIN_CACHE_TTL_S:
+            domain_cache[domain] = entry
+    return domain_cache
 
-        # -------- LOGGING (ADDED)
-        print(f"\nPASS {pass_count}")
-        print(f"Concurrency: {concurrency}")
-        print(f"Total episodes: {len(episodes_list)}")
-        print(f"Success: {success_count}")
-        print(f"Failed: {len(failed)}")
+def save_domain_cache(domain_cache):
+    if orjson:
+        data = orjson.dumps(domain_cache, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    else:
+        data = json.dumps(
+            domain_cache, indent=2, sort_keys=True, ensure_ascii=False
+        ).encode("utf-8")
+    # a run killed mid-write must not cost the whole cache
+    tmp = DOMAIN_CACHE_JSON.with_suffix(".json.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(DOMAIN_CACHE_JSON)
 
-        # adaptive concurrency
-        if success_count == len(episodes_list) and concurrency < MAX_CONCURRENCY:
-            concurrency += CONCURRENCY_STEP
-        elif success_count < len(episodes_list) and concurrency > MIN_CONCURRENCY:
-            concurrency -= CONCURRENCY_STEP
+# ---------------------------
+def dump_results(results):
+    if orjson:
+        return orjson.dumps(results, option=orjson.OPT_INDENT_2)
+    return json.dumps(results, indent=2, ensure_ascii=False).encode("utf-8")
+
+def write_output(data):
+    # readers only ever see a complete file
+    OUTPUT_TMP.write_bytes(data)
+    OUTPUT_TMP.replace(OUTPUT_JSON)
 
-        episodes_list = failed
-        pass_count += 1
+async def flusher(results, stop):
+    # a killed run keeps everything found up to the last flush
+    while True:
+        try:
+            async with asyncio.timeout(FLUSH_INTERVAL_S):
+                await stop.wait()
+            return
+        except TimeoutError:
+            # serialize on the loop, results is still being filled in
+            await asyncio.to_thread(write_output, dump_results(results))
+
+def load_resume(player_data):
+    # only an output written after the current player links belongs to
+    # this run; on CI the checkout is older than generate_players.py output
+    if not OUTPUT_JSON.exists():
+        return {}
+    if OUTPUT_JSON.stat().st_mtime < PLAYER_JSON.stat().st_mtime:
+        return {}
+    try:
+        raw = OUTPUT_JSON.read_bytes()
+        previous = orjson.loads(raw) if orjson else json.loads(raw)
+    except ValueError:
+        return {}
+
+    results = {}
+    for channel, shows in player_data.items():
+        for show, episodes in shows.items():
+            done = previous.get(channel, {}).get(show, {})
+            for episode in episodes:
+                if done.get(episode):
+                    results.setdefault(channel, {}).setdefault(show, {})[episode] = done[episode]
+    return results
 
 # ---------------------------
 async def main():
     if not PLAYER_JSON.exists():
-        print("player_links.json not found")
+        log.error("player_links.json not found")
         return
 
-    with PLAYER_JSON.open("r", encoding="utf-8") as f:
-        player_data = json.load(f)
+    raw = PLAYER_JSON.read_bytes()
+    player_data = orjson.loads(raw) if orjson else json.loads(raw)
 
-    results = {}
-    domain_cache = {}
+    # a rerun after a crash picks up where the last flush left off
+    results = load_resume(player_data)
+    # winners from earlier runs go first on the very first attempt
+    domain_cache = load_domain_cache()
 
+    stop = asyncio.Event()
+    flush_task = asyncio.create_task(flusher(results, stop))
+    try:
+        await run_browser(player_data, results, domain_cache)
+    except Exception as exc:
+        # only the TaskGroups in run_browser wrap failures in a group
+        failures = exc.exceptions if isinstance(exc, ExceptionGroup) else (exc,)
+        for failure in failures:
+            log.error("✖ run aborted", exc_info=failure)
+        return 1
+    finally:
+        stop.set()
+        await flush_task
+        save_domain_cache(domain_cache)
+        write_output(dump_results(results))
+
+# ---------------------------
+async def run_browser(player_data, results, domain_cache):
     async with async_playwright() as p:
-        browser = await p.chromium.launch(
+        context = await p.chromium.launch_persistent_context(
+            user_data_dir=CHROME_PROFILE_DIR,
             headless=True,
             args=[
                 "--disable-blink-features=AutomationControlled",
-                "--disable-features=UserAgentClientHint",
+                # Chromium honours only the last --disable-features, keep them merged
+                "--disable-features=UserAgentClientHint,OptimizationHints",
+                # one network service in the browser process, no extra IPC hop
+                "--enable-features=NetworkServiceInProcess",
                 "--no-sandbox",
                 "--disable-dev-shm-usage",
+                f"--disk-cache-dir={CHROME_CACHE_DIR.resolve()}",
+                f"--disk-cache-size={DISK_CACHE_BYTES}",
+                f"--media-cache-size={MEDIA_CACHE_BYTES}",
             ],
-        )
-
-        context = await browser.new_context(
-            user_agent=(
-                "Mozilla/5.0 (X11; Linux x86_64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/120.0.0.0 Safari/537.36"
-            ),
+            user_agent=USER_AGENT,
             locale="en-US",
             viewport={"width": 1366, "height": 768},
         )
@@ -153,14 +512,63 @@ async def main():
             for show, episodes in shows.items():
                 results[channel].setdefault(show, {})
                 for episode, players in episodes.items():
+                    if episode in results[channel][show]:
+                        continue
                     episodes_list.append((channel, show, episode, players))
+        resumed = sum(len(e) for shows in results.values() for e in shows.values())
+        if resumed:
+            log.info(f"Resuming: {resumed} episodes already extracted")
 
-        await adaptive_runner(context, episodes_list, results, domain_cache)
-        await browser.close()
+        # pages are reused across episodes instead of opened per episode;
+        # every running episode may hold one tab per player
+        max_players = max((len(e[3]) for e in episodes_list), default=1)
+        page_pool = asyncio.Queue()
+        # tabs are opened concurrently so the pool is warm before work starts
+        tabs = await asyncio.gather(
+            *(new_tab(context) for _ in range(MAX_CONCURRENCY * max(max_players, 1)))
+        )
+        for tab in tabs:
+            page_pool.put_nowait(tab)
+
+        download_queue = asyncio.Queue()
+        async with (
+            downloader.make_session() as session,
+            aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}) as head_session,
+            asyncio.TaskGroup() as tg,
+        ):
+            for _ in range(DOWNLOAD_WORKERS):
+                tg.create_task(download_consumer(download_queue, session))
+            await adaptive_runner(
+                page_pool, DeadUrlProbe(head_session), episodes_list, results,
+                domain_cache, download_queue,
+            )
+            for _ in range(DOWNLOAD_WORKERS):
+                download_queue.put_nowait(None)
 
-    with OUTPUT_JSON.open("w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
+        # tab resets that outlived a timed-out episode
+        await asyncio.gather(*cleanups, return_exceptions=True)
+        await context.close()
+
+# ---------------------------
+def start_log_listener():
+    # workers only enqueue records; one thread does the blocking writes.
+    # Set up here rather than relying on whatever the downloader import
+    # configured, whose handlers would be replaced anyway
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(records)]
+    root.setLevel(logging.INFO)
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    return listener
 
 # ---------------------------
 if __name__ == "__main__":
-    asyncio.run(main())
+    listener = start_log_listener()
+    try:
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop else None) as runner:
+            sys.exit(runner.run(main()))
+    finally:
+        listener.stop()
@@ -1,18 +1,31 @@
 # ---------------------------
 # fast_episode_players_requests_json.py
 # ---------------------------
+import asyncio
+import calendar
 import json
-import requests
-from lxml import html
+import re
+import aiohttp
+from lxml import etree, html
 from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ---------------------------
 # CONFIG & CONSTANTS
 # ---------------------------
 BASE_DIR = Path.cwd()
 CONFIG_FILE = BASE_DIR / "config" / "shows.json"
 KEEP_DAYS = 7
+FETCH_CONCURRENCY = 8  # pages in flight across all shows
+FETCH_TIMEOUT = 30
+# every page is on the same host; keep its sockets warm between fetches
+KEEPALIVE_TIMEOUT = 75
+DNS_CACHE_TTL = 300
 HEADERS = {
     "User-Agent": (
         "Mozilla/5.0 (X11; Linux x86_64) "
@@ -21,43 +34,57 @@ HEADERS = {
     )
 }
 
+# full and abbreviated month names, built once
+MONTHS = {
+    name.lower(): i
+    for names in (calendar.month_name, calendar.month_abbr)
+    for i, name in enumerate(names)
+    if name
+}
+DATE_RE = re.compile(r"(\d{1,2})(?:st|nd|rd|th)? (\w+) (\d{4})", re.IGNORECASE)
+
+# compiled once instead of reparsed on every page and paragraph
+EPISODE_LINKS_XPATH = etree.XPath("//div[contains(@class,'layout_post_1')]//h4/a")
+PARAGRAPHS_XPATH = etree.XPath("//p")
+LABEL_XPATH = etree.XPath(".//b/span")
+LINKS_XPATH = etree.XPath(".//a")
+
 # ---------------------------
 # PARSE EPISODE DATE FROM TITLE
 # ---------------------------
 def parse_episode_date(title):
-    import re, calendar
-
     title_lower = title.lower()
     if "preview" in title_lower or "promo" in title_lower:
         return None
 
-    match = re.search(r"(\d{1,2})(?:st|nd|rd|th)? (\w+) (\d{4})", title, re.IGNORECASE)
+    match = DATE_RE.search(title)
     if not match:
         return None
 
     day, month_str, year = match.groups()
-    month_str_cap = month_str.capitalize()
-
-    try:
-        month = list(calendar.month_name).index(month_str_cap)
-    except ValueError:
-        try:
-            month = list(calendar.month_abbr).index(month_str_cap)
-        except ValueError:
-            return None
+    month = MONTHS.get(month_str.lower())
+    if month is None:
+        return None
 
     return datetime(int(year), month, int(day), tzinfo=timezone.utc).date()
 
+# ---------------------------
+# FETCH
+# ---------------------------
+async def fetch(session, sem, url):
+    async with sem:
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+
 # ---------------------------
 # GET EPISODES FROM SHOW PAGE
 # ---------------------------
-def get_episode_links(show_url):
+async def get_episode_links(session, sem, show_url):
     today = datetime.now(timezone.utc).date()
     try:
-        resp = requests.get(show_url, headers=HEADERS, timeout=30)
-        resp.raise_for_status()
-        tree = html.fromstring(resp.content)
-        eps = tree.xpath("//div[contains(@class,'layout_post_1')]//h4/a")
+        tree = html.fromstring(await fetch(session, sem, show_url))
+        eps = EPISODE_LINKS_XPATH(tree)
         results = []
         for e in eps:
             title = e.text_content().strip()
@@ -73,16 +100,14 @@ def get_episode_links(show_url):
 # ---------------------------
 # GET PLAYERS FROM EPISODE PAGE
 # ---------------------------
-def get_players(episode_url):
+async def get_players(session, sem, episode_url):
     players = {}
     try:
-        resp = requests.get(episode_url, headers=HEADERS, timeout=30)
-        resp.raise_for_status()
-        tree = html.fromstring(resp.content)
-        paragraphs = tree.xpath("//p")
+        tree = html.fromstring(await fetch(session, sem, episode_url))
+        paragraphs = PARAGRAPHS_XPATH(tree)
 
         for i, p in enumerate(paragraphs):
-            b = p.xpath(".//b/span")
+            b = LABEL_XPATH(p)
             if not b:
                 continue
             text = b[0].text_content().strip().lower()
@@ -91,7 +116,7 @@ def get_players(episode_url):
 
             if i + 1 < len(paragraphs):
                 next_p = paragraphs[i + 1]
-                a = next_p.xpath(".//a")
+                a = LINKS_XPATH(next_p)
                 if a:
                     link = a[0].get("href")
                     players[text] = link
@@ -99,48 +124,81 @@ def get_players(episode_url):
         print(f"        ⚠️ Player fetch failed: {e}")
     return players
 
+# ---------------------------
+# SCRAPE ONE SHOW
+# ---------------------------
+async def scrape_show(session, sem, channel_key, slug):
+    show_url = f"https://www.desitellybox.to/category/{channel_key}/{slug}/"
+    episodes = await get_episode_links(session, sem, show_url)
+    # all episode pages of the show are fetched at once
+    players = await asyncio.gather(
+        *(get_players(session, sem, ep["url"]) for ep in episodes)
+    )
+    return show_url, episodes, players
+
 # ---------------------------
 # MAIN
 # ---------------------------
-def main():
+async def main():
     try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            config = json.load(f)
+        raw = CONFIG_FILE.read_bytes()
+        config = orjson.loads(raw) if orjson else json.loads(raw)
     except FileNotFoundError:
         print(f"⚠️ {CONFIG_FILE} not found!")
         return
 
-    output = {}
-
-    for channel_key, channel_data in config.items():
-        print(f"\n📺 CHANNEL: {channel_key}")
-        output[channel_key] = {}
-
-        for slug in channel_data.get("shows", []):
-            show_url = f"https://www.desitellybox.to/category/{channel_key}/{slug}/"
-            print(f"\n  ▶ SHOW: {slug}")
-            print(f"      🔗 {show_url}")
-
-            episodes = get_episode_links(show_url)
-            if not episodes:
-                print("    ⚠️ No episodes found for last 7 days.")
-                continue
-
-            output[channel_key][slug] = {}
-
-            for ep in episodes:
-                print(f"\n    ▸ {ep['title']}")
-                print(f"        🔗 {ep['url']}")
-                players = get_players(ep["url"])
-                output[channel_key][slug][ep['title']] = players
+    shows = [
+        (channel_key, slug)
+        for channel_key, channel_data in config.items()
+        for slug in channel_data.get("shows", [])
+    ]
+
+    sem = asyncio.Semaphore(FETCH_CONCURRENCY)
+    async with aiohttp.ClientSession(
+        headers=HEADERS,
+        timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT),
+        connector=aiohttp.TCPConnector(
+            limit=FETCH_CONCURRENCY,
+            limit_per_host=FETCH_CONCURRENCY,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=DNS_CACHE_TTL,
+        ),
+    ) as session:
+        scraped = await asyncio.gather(
+            *(scrape_show(session, sem, channel_key, slug) for channel_key, slug in shows)
+        )
+
+    # report and assemble in config order once everything is in
+    output = {channel_key: {} for channel_key in config}
+    last_channel = None
+    for (channel_key, slug), (show_url, episodes, players) in zip(shows, scraped):
+        if channel_key != last_channel:
+            print(f"\n📺 CHANNEL: {channel_key}")
+            last_channel = channel_key
+        print(f"\n  ▶ SHOW: {slug}")
+        print(f"      🔗 {show_url}")
+
+        if not episodes:
+            print("    ⚠️ No episodes found for last 7 days.")
+            continue
+
+        output[channel_key][slug] = {}
+
+        for ep, ep_players in zip(episodes, players):
+            print(f"\n    ▸ {ep['title']}")
+            print(f"        🔗 {ep['url']}")
+            output[channel_key][slug][ep['title']] = ep_players
 
     # Save all player links in structured JSON
-    with open("player_links.json", "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=4)
+    if orjson:
+        Path("player_links.json").write_bytes(orjson.dumps(output, option=orjson.OPT_INDENT_2))
+    else:
+        with open("player_links.json", "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
     print("\n✅ Saved all player links to player_links.json")
 
 # ---------------------------
 # SAFE RUN
 # ---------------------------
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -1,3 +1,4 @@
+import calendar
 import re
 from pathlib import Path
 from datetime import datetime, timedelta
@@ -20,6 +21,8 @@ DAYS_LIMIT = 8
 DATE_RE = re.compile(
     r"(\d{1,2})(st|nd|rd|th)_([A-Za-z]+)_(\d{4})"
 )
+# full month names only, case-insensitive, as %B accepted
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
 
 def extract_date(name: str):
     m = DATE_RE.search(name)
@@ -27,11 +30,11 @@ def extract_date(name: str):
         return None
 
     day, _, month, year = m.groups()
+    month = MONTHS.get(month.lower())
+    if month is None:
+        return None
     try:
-        return datetime.strptime(
-            f"{day} {month} {year}",
-            "%d %B %Y"
-        )
+        return datetime(int(year), month, int(day))
     except ValueError:
         return None
 
@@ -46,15 +49,14 @@ def raw_url(path: Path):
     )
 
 # ---------------------------
-# MAIN
+# ENTRIES
 # ---------------------------
-def main():
-    cutoff = datetime.utcnow() - timedelta(days=DAYS_LIMIT)
-
-    entries = []
-
+def iter_entries(cutoff):
+    # (title, group, url) tuples, streamed straight into sorted()
     for m3u8 in BASE_DIR.rglob("*.m3u8"):
-        date = extract_date(m3u8.name)
+        # the stem is shorter to scan and is reused for the title
+        stem = m3u8.stem
+        date = extract_date(stem)
         if not date or date < cutoff:
             continue
 
@@ -66,24 +68,26 @@ def main():
         show = rel_parts[1]
         group_title = f"{channel}/{show}"
 
-        title = m3u8.stem.replace("_", " ")
+        title = stem.replace("_", " ")
 
-        entries.append({
-            "group": group_title,
-            "title": title,
-            "url": raw_url(m3u8)
-        })
+        yield title, group_title, raw_url(m3u8)
+
+# ---------------------------
+# MAIN
+# ---------------------------
+def main():
+    cutoff = datetime.utcnow() - timedelta(days=DAYS_LIMIT)
 
-    entries.sort(key=lambda x: x["title"], reverse=True)
+    entries = sorted(iter_entries(cutoff), key=lambda e: e[0], reverse=True)
 
     with OUTPUT_M3U.open("w", encoding="utf-8") as f:
         f.write("#EXTM3U\n\n")
-        for e in entries:
+        for title, group, url in entries:
             f.write(
-                f'#EXTINF:-1 group-title="{e["group"]}",'
-                f'{e["title"]}\n'
+                f'#EXTINF:-1 group-title="{group}",'
+                f'{title}\n'
             )
-            f.write(e["url"] + "\n\n")
+            f.write(url + "\n\n")
 
     print(f"Playlist generated: {OUTPUT_M3U}")
     print(f"Entries: {len(entries)}")